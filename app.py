@@ -6,7 +6,12 @@ import time
 import string
 import traceback, sys
 import csv
-import pwd
+import errno
+import functools
+import queue
+import shutil
+import tempfile
+from contextlib import contextmanager
 from datetime import datetime
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
@@ -21,6 +26,31 @@ from pprint import *
 
 basedir = os.path.dirname(__file__)
 
+# Patterns used to tidy up and number image file paths
+_SMB_RE = re.compile(r"/gvfs/smb-share:server=([^,]*),share=(.*)", re.ASCII)
+_UNIQ_RE = re.compile(r"(.*)(?=\((?P<num>[0-9]+)\))")
+_SEP = os.sep
+
+# Directories already known to exist, so each is only checked once
+_DIR_OK = set()
+
+# Paths of pictures still being moved to the save folder in the background
+_PENDING_MOVES = set()
+
+# Settings object shared by everything on the GUI thread; see _settings()
+SETTINGS = None
+
+def _settings():
+    ''' Return the shared QSettings, creating it the first time.
+    
+    Only use this from the GUI thread. Other threads (the SettingsWriter
+    and the camera probe) open their own QSettings.
+    '''
+    global SETTINGS
+    if SETTINGS is None:
+        SETTINGS = QSettings("Auburn University", "ImCapp")
+    return SETTINGS
+
 # UTILITY CLASSES ======================================================
 class WorkerSignals(QObject):
     ''' The signals available from a running worker thread.
@@ -32,7 +62,8 @@ class WorkerSignals(QObject):
     finished: pyqtSignal
         No data
     error : pyqtSignal
-        tuple (exctype, value, traceback.format_exc())
+        tuple (exctype, value, traceback); format it with
+        traceback.format_exception(*error) if it is needed
     result : pyqtSignal
         object data returned from processing, anything
     progress : pyqtSignal
@@ -64,29 +95,61 @@ class Worker(QRunnable):
     
     def __init__(self, fn, *args, **kwargs):
         super().__init__()
-        # Store constructor arguments (re-used for processing)
-        self.fn = fn
-        self.args = args
-        self.kwargs = kwargs
         self.signals = WorkerSignals()
         
         # Add the callback to our kwargs
-        # self.kwargs['progress_callback'] = self.signals.progress
+        # kwargs['progress_callback'] = self.signals.progress
+        
+        # Bind the arguments once, after kwargs is final, so run() is a
+        # plain call
+        self._call = functools.partial(fn, *args, **kwargs)
 
     @pyqtSlot()
     def run(self):
         ''' Initialise the runner function with passed args, kwargs. '''
         try:
-            result = self.fn(*self.args, **self.kwargs)
+            result = self._call()
         except:
             traceback.print_exc()
-            exctype, value = sys.exc_info()[:2]
-            self.signals.error.emit((exctype, value, traceback.format_exc()))
+            self.signals.error.emit(sys.exc_info())
         else:
             self.signals.result.emit(result)
         finally:
             self.signals.finished.emit()
 
+def move_file(src, dst, buffer_size = 4 << 20):
+    ''' Move a file, copying it in large chunks if it changes devices.
+    
+    An existing file at `dst` is never overwritten; FileExistsError is
+    raised instead and `src` is left where it is.
+    
+    Parameters
+    ----------
+    src : str
+        Path of the file to move
+    dst : str
+        Destination path
+    buffer_size : int
+        Size in bytes of each read and write when copying (default = 4 MiB)
+    '''
+    try:
+        # Unlike os.replace, link fails if dst already exists
+        os.link(src, dst)
+    except OSError as e:
+        # Copy instead across file systems, e.g. tmpfs to an SMB share, or
+        # where hard links aren't supported
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP):
+            raise
+        with open(src, "rb") as fsrc, open(dst, "xb", buffering=buffer_size) as fdst:
+            try:
+                shutil.copyfileobj(fsrc, fdst, buffer_size)
+            except:
+                # Don't leave half a picture behind
+                fdst.close()
+                os.remove(dst)
+                raise
+    os.remove(src)
+
 class Default():
     file_ext = ".png"
     basename = "Unnamed"
@@ -99,28 +162,29 @@ class Default():
     height = 1944
     low = 1
     high = 100
+    compress_level = 1 # PNG compression 0: none -> 9: most; 1 is fast and still shrinks files a lot
+    
+    keys = ("file_ext", "basename", "save_dir", "initials", "exp_id",
+            "batch_id", "width", "height", "low", "high", "compress_level")
+    
+    def snapshot(settings):
+        ''' Read every setting once and return them as a dict. '''
+        return {key: settings.value(key) for key in Default.keys}
     
     def check_defaults(settings):
-        if not settings.value("file_ext"):
-            settings.setValue("file_ext", Default.file_ext)
-        if not settings.value("basename"):
-            settings.setValue("basename", Default.basename)
-        if not settings.value("save_dir"):
-            settings.setValue("save_dir", Default.save_dir)
-        if not settings.value("initials"):
-            settings.setValue("initials", Default.initials)
-        if not settings.value("exp_id"):
-            settings.setValue("exp_id", Default.exp_id)
-        if not settings.value("batch_id"):
-            settings.setValue("batch_id", Default.batch_id)
-        if not settings.value("width"):
-            settings.setValue("width", Default.width)
-        if not settings.value("height"):
-            settings.setValue("height", Default.height)
-        if not settings.value("low"):
-            settings.setValue("low", Default.low)
-        if not settings.value("high"):
-            settings.setValue("high", Default.high)
+        ''' Fill in missing settings and return a snapshot of all of them.
+        
+        Empty settings fall back to their default. Only keys that are
+        missing altogether are written back, so nothing is rewritten on
+        every start.
+        '''
+        values = Default.snapshot(settings)
+        for key, value in values.items():
+            if not value:
+                values[key] = getattr(Default, key)
+                if not settings.contains(key):
+                    settings.setValue(key, values[key])
+        return values
             
     def clear_defaults(settings):
         settings.clear()
@@ -137,6 +201,7 @@ class Default():
         settings.setValue("height", Default.height)
         settings.setValue("low", Default.low)
         settings.setValue("high", Default.high)
+        settings.setValue("compress_level", Default.compress_level)
     
     def set_default_dimensions(settings, width, height):
         Default.width = width
@@ -144,6 +209,92 @@ class Default():
         settings.setValue("width", Default.width)
         settings.setValue("height", Default.height)
 
+class SettingsWriter(QThread):
+    ''' Thread that saves settings in the background.
+    
+    Writes are queued with `enqueue` and saved in order by the thread's
+    own QSettings, so the GUI never waits on the settings file.
+    '''
+    _instance = None
+    
+    def __init__(self):
+        super().__init__()
+        self.queue = queue.Queue()
+    
+    @classmethod
+    def instance(cls):
+        if cls._instance is None:
+            cls._instance = SettingsWriter()
+        return cls._instance
+    
+    def enqueue(self, key, value):
+        if self.isRunning():
+            self.queue.put((key, value))
+        else:
+            _settings().setValue(key, value)
+    
+    def run(self):
+        settings = QSettings("Auburn University", "ImCapp")
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+            settings.setValue(*item)
+            # Write the file once per burst of changes, not once per value
+            if self.queue.empty():
+                settings.sync()
+            self.queue.task_done()
+        settings.sync()
+    
+    @pyqtSlot()
+    def stop(self):
+        ''' Save everything still queued and stop the thread. '''
+        if self.isRunning():
+            self.queue.put(None)
+            self.queue.join()
+            self.wait()
+
+class _SettingsCache():
+    ''' In-memory copy of the saved settings.
+    
+    Every setting is read from QSettings once, the first time one is
+    needed, with missing ones filled in from `Default`. `set` only writes
+    to QSettings when the value actually changes, and `flush` waits for
+    those writes to finish.
+    '''
+    _data = None
+    
+    @classmethod
+    def _load(cls):
+        if cls._data is None:
+            cls._data = Default.check_defaults(_settings())
+        return cls._data
+    
+    @classmethod
+    def get(cls, key):
+        return cls._load().get(key)
+    
+    @classmethod
+    def snapshot(cls):
+        ''' Return a copy of every cached setting as a dict. '''
+        return dict(cls._load())
+    
+    @classmethod
+    def set(cls, key, value):
+        # QSettings hands back numbers as text once they've been saved, so
+        # compare as text to avoid rewriting a value that hasn't changed
+        if str(cls.get(key)) != str(value):
+            cls._data[key] = value
+            SettingsWriter.instance().enqueue(key, value)
+    
+    @classmethod
+    def flush(cls):
+        ''' Wait until every queued write has been handed to QSettings. '''
+        writer = SettingsWriter.instance()
+        if writer.isRunning():
+            writer.queue.join()
+
 class PicPath(QObject):
     ''' A class representing the names and paths of image files
     
@@ -171,22 +322,21 @@ class PicPath(QObject):
     # Static variables shared between all instances of PicPath
     # Access with PicPath.variable
     uid = os.getuid()
-    pwuser = pwd.getpwuid(uid).pw_name
+    home = QStandardPaths.writableLocation(QStandardPaths.HomeLocation)
     today = datetime.now().strftime("%Y-%m-%d")
     script_dir = os.path.dirname(os.path.realpath(__file__))
-    settings = QSettings("Auburn University", "ImCapp")
     # Default.check_defaults(settings)
 
-    save_dir = settings.value("save_dir") if settings.value("save_dir") else Default.save_dir
+    save_dir = _SettingsCache.get("save_dir")
     if save_dir[0] != "/":
-        save_dir = os.path.join("home", pwuser, save_dir)
+        save_dir = f"{home}{_SEP}{save_dir}"
     # if not os.path.isdir(save_dir):
         # save_dir = script_dir
     
-    default_fileext = settings.value("file_ext") if settings.value("file_ext") else Default.file_ext
-    default_basename = settings.value("basename") if settings.value("basename") else Default.basename
+    default_fileext = _SettingsCache.get("file_ext")
+    default_basename = _SettingsCache.get("basename")
     default_filename = default_basename + default_fileext
-    current_filepath = os.path.join(os.path.sep, save_dir, default_filename)
+    current_filepath = f"{_SEP}{save_dir.strip(_SEP)}{_SEP}{default_filename}"
     # current_prettypath = current_filepath
     
     def __init__(
@@ -201,88 +351,120 @@ class PicPath(QObject):
         super().__init__()
         # folder_id = "_".join([PicPath.today, initials, prefix])
         
-        self._basename = basename
-        self._fileext = fileext
-        self._filename = self._basename + self._fileext
-        self._directory = os.path.join(os.path.sep, in_dir, initials, exp_id, "RawPhotos", batch_id + "_" + PicPath.today)
-        self._filepath = os.path.join(os.path.sep, self._directory, self._filename)
-        # self.prettypath = self.make_filepath_pretty1()
-        
-        # if not os.path.isdir(self._directory):
-            # os.makedirs(self._directory)
-        
-        if self.basename == PicPath.default_basename:
-            unique = self.make_filepath_unique()
-            self.directory, tail = os.path.split(unique)
-            self.basename, self.fileext = os.path.splitext(tail)
-            PicPath.default_basename = self.basename
-            PicPath.default_filename = self.filename
+        self._mute = False
+        self._dir_cache = None
+        self._dir_cache_path = None
+        self._numbered_key = None
+        self._numbered = None
+        self._rebuild(initials, exp_id, batch_id, basename, fileext, in_dir)
     
     def update(self, initials, exp_id = None, batch_id = None, basename = default_basename,
                  fileext = default_fileext, in_dir = save_dir):
+        self._rebuild(initials, exp_id, batch_id, basename, fileext, in_dir)
+    
+    def _rebuild(self, initials, exp_id, batch_id, basename, fileext, in_dir):
+        ''' Set every part of the path and emit `filepathChanged` once. '''
         self._basename = basename
         self._fileext = fileext
         self._filename = self._basename + self._fileext
-        self._directory = os.path.join(os.path.sep, in_dir, initials, exp_id, batch_id + "_" + PicPath.today)
-        self._filepath = os.path.join(os.path.sep, self._directory, self._filename)
-        
-        if not os.path.isdir(self._directory):
-            os.makedirs(self._directory)
+        self._directory = f"{_SEP}{in_dir.strip(_SEP)}{_SEP}{initials}{_SEP}{exp_id}{_SEP}RawPhotos{_SEP}{batch_id}_{PicPath.today}"
+        self._dir_cache = None
         
-        if self.basename == PicPath.default_basename:
+        with self.batch():
+            self._rebuild_filepath()
             unique = self.make_filepath_unique()
-            self.directory, tail = os.path.split(unique)
-            self.basename, self.fileext = os.path.splitext(tail)
-            PicPath.default_basename = self.basename
-            PicPath.default_filename = self.filename
+            if self._basename == PicPath.default_basename:
+                self._directory, self._filename = os.path.split(unique)
+                self._basename, self._fileext = os.path.splitext(self._filename)
+                PicPath.default_basename = self._basename
+                PicPath.default_filename = self._filename
+    
+    def _rebuild_filepath(self):
+        ''' Join the directory and file name into `filepath`. '''
+        PicPath.current_filename = self._filename
+        self.filepath = f"{self._directory}{_SEP}{self._filename}"
+    
+    @contextmanager
+    def batch(self):
+        ''' Change several parts of the path but emit `filepathChanged` once. '''
+        self._mute = True
+        try:
+            yield self
+        finally:
+            self._mute = False
+        self.filepathChanged.emit(self._filepath)
     
     def make_filepath_pretty(value):
-        smb_match = re.search("/gvfs/smb-share:server=(.*),share=(.*)", value)
+        # Most paths aren't on a mounted share, so skip the regex for them
+        if "/gvfs/smb-share:" not in value:
+            return value
+        smb_match = _SMB_RE.search(value)
         if smb_match:
             return "smb://" + "/".join(smb_match.group(1,2))
         else:
             return value
     
-    def make_filepath_pretty1(self):
-        smb_match = re.search("/gvfs/smb-share:server=(.*),share=(.*)", self.filepath)
-        if smb_match:
-            return "smb://" + "/".join(smb_match.group(1,2))
-        else:
-            return self.filepath
-        
     # def check_picture_exists():
     #     return os.path.exists(PicPath.current_filepath)
 
     def make_filepath_unique(self):
         path = self.filepath
-        if not os.path.exists(path):
+        head, tail = os.path.split(path)
+        existing = self.list_directory(head)
+        if tail not in existing:
             return path
         
-        head, tail = os.path.split(path)
         basename, extension = os.path.splitext(tail)
-        group_match = re.match("(.*)(?=\((?P<num>[0-9]+)\))", basename)
-        
-        if not group_match:
-            print("No regex match")
-            num = 1
-        
+        group_match = _UNIQ_RE.match(basename)
         if group_match:
-            print("Found a regex match")
             basename = group_match.group(1)
-            num = int(group_match.group("num"))
-            path = basename + "(" + str(num) + ")" + extension
-        
-        filename = basename + "(" + str(num) + ")" + extension
-        path = os.path.join(os.path.sep, head, filename)
         
-        while os.path.exists(path):
-            filename = basename + "(" + str(num) + ")" + extension
-            path = os.path.join(os.path.sep, head, filename)
-            num += 1
+        # Number the file one past the highest "basename(N)" already saved.
+        # The pattern only changes with the name, so keep it between calls
+        if self._numbered_key != (basename, extension):
+            self._numbered_key = (basename, extension)
+            self._numbered = re.compile(re.escape(basename) + r"\(([0-9]+)\)" + re.escape(extension))
+        numbered = self._numbered
+        nums = [int(match.group(1)) for match in map(numbered.fullmatch, existing) if match]
+        filename = basename + "(" + str(max(nums, default=0) + 1) + ")" + extension
+        path = f"{head}{_SEP}{filename}"
         
         self.filepath = path
         return path
     
+    def list_directory(self, directory):
+        ''' Return the set of file names in `directory`.
+        
+        The listing is read once and cached so that repeated captures
+        into the same folder don't go back to the (possibly network)
+        file system. The cache is dropped when the directory changes.
+        Pictures still being moved into `directory` are listed too.
+        '''
+        if self._dir_cache is None or self._dir_cache_path != directory:
+            try:
+                with os.scandir(directory) as entries:
+                    self._dir_cache = {entry.name for entry in entries}
+            except FileNotFoundError:
+                self._dir_cache = set()
+            for pending in _PENDING_MOVES:
+                head, tail = os.path.split(pending)
+                if head == directory:
+                    self._dir_cache.add(tail)
+            self._dir_cache_path = directory
+        return self._dir_cache
+    
+    @pyqtSlot(str)
+    def mark_existing(self, filepath):
+        ''' Record that a file now exists at `filepath`. '''
+        head, tail = os.path.split(filepath)
+        if self._dir_cache is not None and self._dir_cache_path == head:
+            self._dir_cache.add(tail)
+    
+    def forget_directory(self, filepath):
+        ''' Drop the cached listing if it is of the folder `filepath` is in. '''
+        if self._dir_cache_path == os.path.dirname(filepath):
+            self._dir_cache = None
+    
     # GETTERS AND SETTERS ==============================================
     @property
     def basename(self):
@@ -291,7 +473,8 @@ class PicPath(QObject):
     @basename.setter
     def basename(self, value):
         self._basename = value
-        self.filename =  value + self.fileext
+        self._filename = value + self._fileext
+        self._rebuild_filepath()
 
     @property
     def fileext(self):
@@ -300,7 +483,8 @@ class PicPath(QObject):
     @fileext.setter
     def fileext(self, value):
         self._fileext = value
-        self.filename = self.basename + value
+        self._filename = self._basename + value
+        self._rebuild_filepath()
 
     @property
     def filename(self):
@@ -309,8 +493,7 @@ class PicPath(QObject):
     @filename.setter
     def filename(self, value):
         self._filename = value
-        PicPath.current_filename = value
-        self.filepath = os.path.join(os.path.sep, self.directory, value)
+        self._rebuild_filepath()
     
     @property
     def directory(self):
@@ -318,8 +501,9 @@ class PicPath(QObject):
     
     @directory.setter
     def directory(self, value):
-        self._directory = value
-        self.filepath = os.path.join(os.path.sep, value, self.filename)
+        self._directory = value.rstrip(_SEP)
+        self._dir_cache = None
+        self._rebuild_filepath()
     
     @property
     def filepath(self):
@@ -329,7 +513,8 @@ class PicPath(QObject):
     def filepath(self, value):
         self._filepath = value
         PicPath.current_filepath = value
-        self.filepathChanged.emit(value)
+        if not self._mute:
+            self.filepathChanged.emit(value)
 
 
 # GUI WIDGETS ==========================================================
@@ -338,7 +523,9 @@ class MainWindow(QMainWindow):
     
     Parameters
     ----------
-    camera : Picamera2()
+    camera : Picamera2() or None
+        The camera, or None to show a placeholder until `find_camera`
+        finds one
     args : type
     kwargs : type
     
@@ -353,8 +540,7 @@ class MainWindow(QMainWindow):
     
     def __init__(self, camera, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.settings = QSettings("Auburn University", "ImCapp")
-        Default.check_defaults(self.settings)
+        self.settings = _settings()
         self.load_settings()
         
         start_dlg = StartUpDialog(self)
@@ -362,16 +548,17 @@ class MainWindow(QMainWindow):
             print("User canceled start-up")
             raise SystemExit
         
-        self.filepath_found = False
-        
         self._initials = start_dlg.options_widget.initialsLineEdit.text().upper()
         self._exp_id = start_dlg.options_widget.experimentSpinBox.text()
         self._batch_id = start_dlg.options_widget.batchSpinBox.text()
+        self.file_ext = start_dlg.options_widget.formatComboBox.currentText()
         self.folder_id = self.exp_id + self.batch_id
         self.prefix = self.folder_id
 
         self.current_vial_num = None
-        self.current_picpath = PicPath(self.initials, self.exp_id, self.batch_id)
+        # Made the first time a vial list is generated and reused after
+        self.vial_list_dlg = None
+        self.current_picpath = PicPath(self.initials, self.exp_id, self.batch_id, fileext = self.file_ext)
         self.current_picpath.filepathChanged.connect(self.update_filename)
         
         # Make a new composite widget to use as the main widget for the
@@ -394,21 +581,16 @@ class MainWindow(QMainWindow):
         if start_dlg.options_widget.checkbox.isChecked():
             self.low = start_dlg.options_widget.lowestSpinBox.text()
             self.high = start_dlg.options_widget.highestSpinBox.text()
-            [self.manage_vials_widget.add_vial_unique(vial) for vial in self.make_vial_list(self.low, self.high, self.prefix)]
+            self.manage_vials_widget.add_vials_unique(self.make_vial_list(self.low, self.high, self.prefix))
 
         self.manage_vials_widget.vialSelected.connect(self.on_vial_selected)
         self.manage_vials_widget.list_controls.deselect_button.clicked.connect(self.reset_filename)
         self.manage_vials_widget.list_controls.create_list_button.clicked.connect(self.do_vial_list_dlg)
         self.manage_vials_widget.list_controls.save_list_button.clicked.connect(self.save_vial_list)
 
-        # Create right pane using custom widgets for managing camera
-        try:
-            self.camera_preview = CameraPreviewWidget(camera, self.width, self.height)
-            af_available = True if "AfMode" in camera.camera_controls else False
-        except:
-            self.camera_preview = PreviewPlaceholderWidget()
-            af_available = False
-            
+        # Create right pane using custom widgets for managing camera. The
+        # placeholder is swapped for a live preview once a camera is found
+        self.camera_preview = PreviewPlaceholderWidget()
         self.manage_camera_widget = CameraControls(self.camera_preview)
         self.manage_camera_widget.capture_button.clicked.connect(self.check_filepath)
         self.camera_preview.picTaken.connect(self.advance)
@@ -416,6 +598,9 @@ class MainWindow(QMainWindow):
         self.manage_camera_widget.do_disable_GUI.connect(self.disable_GUI)
         self.manage_camera_widget.do_enable_GUI.connect(self.enable_GUI)
         
+        if camera is not None:
+            self.on_camera_ready(camera)
+        
         # Add widgets to the window's layout so they display when the 
         # window is loaded
         # layout.addWidget(self.manage_vials_widget, 20)
@@ -437,42 +622,106 @@ class MainWindow(QMainWindow):
         # self.camera_preview.setSizeIncrement(4, 3)
         # self.camera_preview.
         # print(self.camera_preview.sizeHint())
+    
+    def find_camera(self):
+        ''' Look for the camera in the background so the window can be
+        shown right away. The camera buttons are enabled once the search
+        is done. '''
+        self.disable_GUI()
+        probe_worker = Worker(probe_camera)
+        probe_worker.signals.result.connect(self.on_camera_ready)
+        probe_worker.signals.error.connect(self.camera_failed)
+        QThreadPool.globalInstance().start(probe_worker)
+    
+    @pyqtSlot(object)
+    def on_camera_ready(self, camera):
+        ''' Replace the placeholder with a live preview of `camera`.
+        
+        Parameters
+        ----------
+        camera : Picamera2 or None
+            The camera that was found, or None if there isn't one
+        '''
+        if camera is None:
+            self.manage_camera_widget.af_controls.hide()
+            self.enable_GUI()
+            return
+        
+        self.camera_preview = CameraPreviewWidget(camera, Default.width, Default.height)
+        self.camera_preview.picSaved.connect(self.current_picpath.mark_existing)
+        self.camera_preview.picExists.connect(self.on_pic_exists)
+        self.camera_preview.picTaken.connect(self.advance)
+        self.manage_camera_widget.set_preview(self.camera_preview)
+        
+        # Start the camera in the background; the camera buttons are
+        # enabled once it is running
+        self.disable_GUI()
+        camera_worker = Worker(self.camera_preview.start_camera)
+        camera_worker.signals.result.connect(self.enable_GUI)
+        camera_worker.signals.error.connect(self.camera_failed)
+        QThreadPool.globalInstance().start(camera_worker)
         
-        if af_available:
+        if "AfMode" in camera.camera_controls:
             print(camera.camera_controls["AfMode"])
         else:
             self.manage_camera_widget.af_controls.hide()
     
+    @pyqtSlot(tuple)
+    def camera_failed(self, error):
+        ''' Go back to the placeholder when the camera can't be used. '''
+        print("Could not start camera:", error[1])
+        self.camera_preview = PreviewPlaceholderWidget()
+        self.camera_preview.picTaken.connect(self.advance)
+        self.manage_camera_widget.set_preview(self.camera_preview)
+        self.manage_camera_widget.af_controls.hide()
+        self.enable_GUI()
+    
     @pyqtSlot(str)
     def on_vial_selected(self, new_basename):
-        self.current_picpath.basename = new_basename
-        self.current_picpath.make_filepath_unique()
+        with self.current_picpath.batch():
+            self.current_picpath.basename = new_basename
+            self.current_picpath.make_filepath_unique()
+    
+    @pyqtSlot(str)
+    def on_pic_exists(self, filepath):
+        ''' Number the next picture from a fresh listing of the folder,
+        since files were added to it that the cached listing missed. '''
+        with self.current_picpath.batch():
+            self.current_picpath.forget_directory(filepath)
+            self.current_picpath.make_filepath_unique()
     
     @pyqtSlot(str)
     def on_fileext_change(self, new_ext):
-        self.current_picpath.fileext = new_ext
+        with self.current_picpath.batch():
+            self.current_picpath.fileext = new_ext
+            self.current_picpath.make_filepath_unique()
         
     @pyqtSlot(bool)
     def advance(self, success):
         if success == True:
-            self.update_filename()
+            with self.current_picpath.batch():
+                self.current_picpath.make_filepath_unique()
             
     @pyqtSlot()
     def update_filename(self):
-        self.current_picpath.make_filepath_unique()
-        self.manage_camera_widget.filename_label.setText("The file will be named:\n" + PicPath.make_filepath_pretty(PicPath.current_filepath))
+        ''' Show the new filepath, which PicPath has already made unique. '''
+        self.manage_camera_widget.show_filepath(PicPath.current_filepath)
     
     @pyqtSlot()
     def reset_filename(self):
-        self.current_picpath.basename = PicPath.default_basename
+        with self.current_picpath.batch():
+            self.current_picpath.basename = PicPath.default_basename
+            self.current_picpath.make_filepath_unique()
     
     @pyqtSlot()
     def check_filepath(self):
-        ''' Make sure directory exists. '''
-        if not self.filepath_found:
-            if not os.path.isdir(self.current_picpath.directory):
-                os.makedirs(self.current_picpath.directory)
-            self.filepath_found = True
+        ''' Make sure directory exists. The directory is only created
+        when something is saved to it. '''
+        directory = self.current_picpath.directory
+        if directory in _DIR_OK:
+            return
+        os.makedirs(directory, exist_ok=True)
+        _DIR_OK.add(directory)
             
     @pyqtSlot()
     def enable_GUI(self):
@@ -523,44 +772,74 @@ class MainWindow(QMainWindow):
     @pyqtSlot()
     def pick_directory(self):
         chosen_dir = QFileDialog.getExistingDirectory()
-        self.current_picpath.directory = chosen_dir
+        with self.current_picpath.batch():
+            self.current_picpath.directory = chosen_dir
+            self.current_picpath.make_filepath_unique()
     
     @pyqtSlot()
     def do_vial_list_dlg(self):
-        vial_list_dlg = MakeVialListDialog(self.prefix)
+        if self.vial_list_dlg is None:
+            self.vial_list_dlg = MakeVialListDialog(self.prefix)
+        else:
+            self.vial_list_dlg.reset(self.prefix)
+        vial_list_dlg = self.vial_list_dlg
         if vial_list_dlg.exec():
             # self.low = vial_list_dlg.lowestSpinBox.text()
             # self.high = vial_list_dlg.highestSpinBox.text()
             self.prefix = vial_list_dlg.prefixLineEdit.text()
-            [self.manage_vials_widget.add_vial_unique(vial) for vial in self.make_vial_list(vial_list_dlg.lowestSpinBox.text(), vial_list_dlg.highestSpinBox.text(), vial_list_dlg.prefixLineEdit.text())]
+            self.manage_vials_widget.add_vials_unique(self.make_vial_list(vial_list_dlg.lowestSpinBox.text(), vial_list_dlg.highestSpinBox.text(), vial_list_dlg.prefixLineEdit.text()))
             if vial_list_dlg.if_save.isChecked():
                 self.save_vial_list()
     
     @pyqtSlot()
     def do_settings_dlg(self):
-        settings_dlg = SettingsDialog().open()
-        self.load_settings()
+        self.run_settings_dlg(SettingsDialog())
     
     @pyqtSlot()
     def do_defaults_dlg(self):
         settings_dlg = SettingsDialog()
-        settings_dlg.tabs.setCurrentWidget(settings_dlg.defaults_tab)
-        settings_dlg.open()
+        settings_dlg.select_defaults_tab()
+        self.run_settings_dlg(settings_dlg)
+    
+    def run_settings_dlg(self, settings_dlg):
+        ''' Show `settings_dlg` and apply its file format if it is saved. '''
+        format_box = settings_dlg.settings_tab.formatComboBox
+        format_box.setCurrentText(self.current_picpath.fileext)
+        saved = settings_dlg.open()
         self.load_settings()
+        if saved:
+            self.on_fileext_change(format_box.currentText())
         
     def make_vial_list(self, low, high, prefix = None):
-        return [f'{self.prefix}{i:03}' for i in range(int(low), int(high)+1)]
+        prefix = self.prefix if prefix is None else prefix
+        return (f'{prefix}{i:03}' for i in range(int(low), int(high)+1))
     
     @pyqtSlot()
     def save_vial_list(self):
-        list_file = os.path.join(os.path.sep, self.current_picpath.directory, "vial_list.csv") #TODO: use Default
-        print([self.manage_vials_widget.vial_list.item(i).text() for i in range(0, self.manage_vials_widget.vial_list.count())])
-        with open(list_file, "w") as csv:
-            csv.write('ID\n')
-            size = self.manage_vials_widget.vial_list.count()-1
-            for i in range(0, size):
-                csv.write(self.manage_vials_widget.vial_list.item(i).text() + '\n')
-            csv.write(self.manage_vials_widget.vial_list.item(size).text())
+        self.check_filepath()
+        list_file = f"{self.current_picpath.directory}{_SEP}vial_list.csv" #TODO: use Default
+        payload = "\n".join(["ID", *self.manage_vials_widget.vials, ""]).encode()
+        # Write the file in the background so the GUI doesn't wait on a
+        # slow network share
+        list_worker = Worker(self.write_vial_list, list_file, payload)
+        list_worker.signals.error.connect(functools.partial(self.vial_list_failed, list_file))
+        QThreadPool.globalInstance().start(list_worker)
+    
+    def write_vial_list(self, list_file, payload):
+        ''' Write `payload` to `list_file` with as few write calls as possible. '''
+        fd = os.open(list_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            view = memoryview(payload)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+    
+    def vial_list_failed(self, list_file, error):
+        QMessageBox.warning(
+            self,
+            "Vial list not saved",
+            f"Could not save the vial list to:\n{list_file}\n\n{error[1]}")
     
     def closeEvent(self, event):
         self.save_settings()
@@ -568,26 +847,30 @@ class MainWindow(QMainWindow):
         # print(self.splitter.sizes())
         super().closeEvent(event)
             
-    def load_settings(self):
-        self.initials = self.settings.value("initials")
-        self.exp_id = self.settings.value("exp_id")
-        self.batch_id = self.settings.value("batch_id")
-        self.width = self.settings.value("width")
-        self.height = self.settings.value("height")
-        self.low = self.settings.value("low")
-        self.high = self.settings.value("high")
+    def load_settings(self, values = None):
+        if values is None:
+            values = _SettingsCache.snapshot()
+        self.initials = values["initials"]
+        self.exp_id = values["exp_id"]
+        self.batch_id = values["batch_id"]
+        self.width = values["width"]
+        self.height = values["height"]
+        self.low = values["low"]
+        self.high = values["high"]
         # self.splitter.restoreState(settings.value("splitterSizes").toByteArray())
         
         try:
-            self.current_picpath.update(self.initials, self.exp_id, self.batch_id)
+            self.current_picpath.update(self.initials, self.exp_id, self.batch_id,
+                                        fileext = self.current_picpath.fileext)
         except:
             pass
         
     def save_settings(self):
-        self.settings.setValue("initials", self.initials)
-        self.settings.setValue("exp_id", self.exp_id)
-        self.settings.setValue("batch_id", self.batch_id)
+        _SettingsCache.set("initials", self.initials)
+        _SettingsCache.set("exp_id", self.exp_id)
+        _SettingsCache.set("batch_id", self.batch_id)
         # settings.setValue("splitterSizes", self.splitter.saveState())
+        _SettingsCache.flush()
     
     def check_list_status(self):
         pass
@@ -654,7 +937,13 @@ class CameraControls(QWidget):
         self.picam2 = preview.picam2
         self.af_controls = AFControlsWidget()
         self.capture_button = QPushButton("Take picture")
-        self.filename_label = QLabel("The file will be named:\n" + PicPath.make_filepath_pretty(PicPath.current_filepath))
+        self.filename_label = QLabel()
+        self.filename_label.setTextFormat(Qt.PlainText)
+        self._label_fmt = "The file will be named:\n%s"
+        self._pretty_dir = None
+        self._pretty_prefix = ""
+        self._label_text = None
+        self.show_filepath(PicPath.current_filepath)
         
         # Add the component widgets to the layout in order from top to
         # bottom using integers to define stretch to improve sizing
@@ -675,6 +964,33 @@ class CameraControls(QWidget):
         
         self.preview.picTaken.connect(self.do_enable_GUI.emit)
     
+    def set_preview(self, preview):
+        ''' Show `preview` in place of the current preview widget. '''
+        old_cam = self.cam
+        self.preview = preview
+        self.cam = preview.cam
+        self.picam2 = preview.picam2
+        self.layout().replaceWidget(old_cam, self.cam)
+        old_cam.deleteLater()
+        self.preview.picTaken.connect(self.do_enable_GUI.emit)
+    
+    def show_filepath(self, filepath):
+        ''' Show the path the next picture will be saved to. '''
+        text = self._label_fmt % self._pretty_path(filepath)
+        # Leave the label alone when nothing changed to avoid a relayout
+        if text != self._label_text:
+            self._label_text = text
+            self.filename_label.setText(text)
+    
+    def _pretty_path(self, filepath):
+        # Only tidy up the directory when it changes; picking a new vial
+        # usually just changes the file name
+        head, tail = os.path.split(filepath)
+        if head != self._pretty_dir:
+            self._pretty_dir = head
+            self._pretty_prefix = PicPath.make_filepath_pretty(head)
+        return self._pretty_prefix + _SEP + tail
+    
     @pyqtSlot()
     def capture_button_clicked(self):
         ''' Respond to image capture button being clicked. '''
@@ -683,13 +999,10 @@ class CameraControls(QWidget):
         
         # Check if autofocus must be performed before image is taken
         if self.af_required == True:
-            # Set up a thread to run autofocus
-            af_worker = Worker(self.run_af)
+            # Run autofocus and then start the capture in one worker thread
+            # so neither has to come back to the GUI thread in between
+            af_worker = Worker(self.run_af_then_capture)
             # TODO: if fail, run again -- worker.signals.result.connect(self.print_output)
-            # Link completion of autofocus thread to image capture function
-            af_worker.signals.finished.connect(self.preview.do_capture)
-            # Start autofocus Worker thread, which will start image
-            # capture when autofocus is finished
             QThreadPool.globalInstance().start(af_worker)
         else:
             # Start taking picture immediately since not doing autofocus
@@ -699,6 +1012,13 @@ class CameraControls(QWidget):
     def run_af(self):
         self.picam2.autofocus_cycle(self.cam)
     
+    def run_af_then_capture(self):
+        ''' Run autofocus, then start the capture even if autofocus failed. '''
+        try:
+            self.run_af()
+        finally:
+            self.preview.do_capture()
+    
     @pyqtSlot()
     def run_af_once(self):
         self.do_disable_GUI.emit()
@@ -722,8 +1042,11 @@ class PreviewPlaceholderWidget(QWidget):
     ----------
     picTaken : pyqtSignal
         bool : True if picture was taken successfully, False otherwise
+    picSaved : pyqtSignal
+        str : Path the picture is being saved to (never emitted)
     '''
     picTaken = pyqtSignal(bool)
+    picSaved = pyqtSignal(str)
     
     def __init__(self):
         super().__init__()
@@ -748,8 +1071,15 @@ class CameraPreviewWidget(QWidget):
     ----------
     picTaken : pyqtSignal
         bool : True if picture was taken successfully, False otherwise
+    picSaved : pyqtSignal
+        str : Path the picture is being saved to, emitted before picTaken
+    picExists : pyqtSignal
+        str : Path the picture couldn't be moved to because a file is
+        already there
     '''
     picTaken = pyqtSignal(bool)
+    picSaved = pyqtSignal(str)
+    picExists = pyqtSignal(str)
     
     def __init__(self, camera, width, height):
         super().__init__()
@@ -763,34 +1093,83 @@ class CameraPreviewWidget(QWidget):
         self.height = height
         
         self.picam2.options["quality"] = 95 # JPEG quality 0: lowest -> 95: highest
-        self.picam2.options["compress_level"] = 0 # PNG compression 0: none -> 9: most
+        self.picam2.options["compress_level"] = int(_SettingsCache.get("compress_level")) # PNG compression 0: none -> 9: most
 
         # Transform(hflip=1, vflip=1)
-        self.preview_config = self.picam2.create_preview_configuration(main={"size": (self.width, self.height)})
+        # Keep few buffers so frames can't queue up behind a busy GUI
+        self.preview_config = self.picam2.create_preview_configuration(main={"size": (self.width, self.height)}, buffer_count=2)
         self.capture_config = self.picam2.create_still_configuration(main={"size": (self.width, self.height)})
 
-        self.picam2.configure(self.preview_config)
         # self.cam = QGlPicamera2(self.picam2, width=width, height=height, keep_ar=True)
         self.cam = QPicamera2(self.picam2, width=self.width, height=self.height, keep_ar=True)
-        self.picam2.start()
         self.cam.done_signal.connect(self.capture_pic)
+        
+        # Pictures are saved to local memory first and moved to their
+        # destination afterwards so a slow save folder doesn't hold up
+        # the next picture
+        self._tmp_dir = f"{_SEP}run{_SEP}user{_SEP}{os.getuid()}"
+        if not os.path.isdir(self._tmp_dir):
+            self._tmp_dir = tempfile.gettempdir()
+        self._tmp_dir = os.path.join(self._tmp_dir, "imcapp_tmp")
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        self._tmp_path = None
+        self._dest_path = None
+
+    def start_camera(self):
+        ''' Configure and start the camera. This can take a while, so it
+        can be run on a worker thread. '''
+        self.picam2.configure(self.preview_config)
+        self.picam2.start()
 
     @pyqtSlot()
     def do_capture(self):
         print("Starting image capture for:", PicPath.current_filepath)
+        self._dest_path = PicPath.current_filepath
+        self._tmp_path = os.path.join(self._tmp_dir, os.path.basename(self._dest_path))
         self.picam2.capture_file(
-            PicPath.current_filepath,
+            self._tmp_path,
             wait = False,
             signal_function = self.cam.signal_done)
     
     # @pyqtSlot(picamera2.job.Job)
     def capture_pic(self, job):
-        # print("Executing capture_pic")
-        # print(type(job))
-        self.picam2.wait(job)
-        # print("Picture saved as %s" % (PicPath.current_filepath))
+        # Finish the capture job in the background so the preview keeps
+        # running while the picture is written
+        wait_worker = Worker(self.picam2.wait, job)
+        wait_worker.signals.result.connect(self.save_pic)
+        wait_worker.signals.error.connect(self.capture_failed)
+        QThreadPool.globalInstance().start(wait_worker)
+    
+    @pyqtSlot()
+    def save_pic(self):
+        ''' Move the finished picture to the save folder in the background. '''
+        _PENDING_MOVES.add(self._dest_path)
+        move_worker = Worker(move_file, self._tmp_path, self._dest_path)
+        move_worker.signals.error.connect(
+            functools.partial(self.move_failed, self._tmp_path, self._dest_path))
+        move_worker.signals.finished.connect(
+            functools.partial(_PENDING_MOVES.discard, self._dest_path))
+        QThreadPool.globalInstance().start(move_worker)
+        self.picSaved.emit(self._dest_path)
         self.picTaken.emit(True)
     
+    @pyqtSlot(tuple)
+    def capture_failed(self, error):
+        print("Image capture failed:", error[1])
+        self.picTaken.emit(False)
+    
+    def move_failed(self, tmp_path, dest_path, error):
+        ''' Tell the user where a picture is when it couldn't be moved to
+        the save folder. '''
+        if isinstance(error[1], FileExistsError):
+            self.picExists.emit(dest_path)
+        QMessageBox.warning(
+            self,
+            "Picture not saved",
+            f"Could not move the picture to:\n{dest_path}\n\n{error[1]}\n\n"
+            f"It is still at:\n{tmp_path}\n"
+            "Copy it somewhere safe before logging out.")
+    
     # def sizeHint(self):
         # print("hi")
         # return QSize(self.width, self.height)
@@ -817,20 +1196,79 @@ class AFControlsWidget(QWidget):
 
 
 # VIAL LIST WIDGETS ====================================================
+class VialListModel(QAbstractListModel):
+    ''' A read-only list model of vial names.
+    
+    The names are kept in a plain list for order and a set for fast
+    duplicate checks, so Qt doesn't need an item object per vial.
+    '''
+    
+    def __init__(self, parent = None):
+        super().__init__(parent)
+        self._vials = []
+        self._index = set()
+    
+    def rowCount(self, parent = QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._vials)
+    
+    def data(self, index, role = Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            return self._vials[index.row()]
+        return None
+    
+    def add_unique(self, vials):
+        ''' Append every vial in `vials` that isn't already in the model
+        and return how many were added. '''
+        # dict.fromkeys drops repeats within the batch and keeps the order.
+        # Nothing is changed until the whole batch has been read, so an
+        # error while reading leaves the model as it was
+        index = self._index
+        new_vials = list(dict.fromkeys(vial for vial in vials if vial not in index))
+        if new_vials:
+            index.update(new_vials)
+            row = len(self._vials)
+            self.beginInsertRows(QModelIndex(), row, row + len(new_vials) - 1)
+            self._vials.extend(new_vials)
+            self.endInsertRows()
+        return len(new_vials)
+    
+    def clear(self):
+        ''' Remove every vial. '''
+        self.beginResetModel()
+        self._vials.clear()
+        self._index.clear()
+        self.endResetModel()
+    
+    @property
+    def vials(self):
+        return self._vials
+
 class ManageVialsWidget(QWidget):
     '''
     A composite widget that contains the widgets that manage the list of
     vials being imaged.
     
     Widgets included:
-    - vial_list
+    - vial_list (a QListView showing the vial names)
     - list_controls
     
     Attributes
     ----------
     vialSelected : pyqtSignal
+    vialsAdded : pyqtSignal
+        int : Number of vials added, emitted once per batch
     '''
     vialSelected = pyqtSignal(str)
+    vialsAdded = pyqtSignal(int)
+    
+    # (list_controls button, slot) pairs wired up in __init__
+    _CONNECTIONS = (
+        ("add_from_file_button", "pick_file"),
+        ("deselect_button", "deselect"),
+        ("clear_list_button", "clear_vial_list"),
+        )
     
     def __init__(self):
         super().__init__()
@@ -843,6 +1281,16 @@ class ManageVialsWidget(QWidget):
         self.vial_arrow_next = QPushButton('&Next ->') # '&Next ->'
         self.vial_arrow_prev.setEnabled(False)
         self.vial_arrow_next.setEnabled(False)
+        # Last state given to each arrow, to skip calls that change nothing
+        self._last_prev_en = False
+        self._last_next_en = False
+        # Update the arrows at most once a frame while the selection is
+        # moving quickly, e.g. with a held arrow key
+        self._nav_timer = QTimer(self)
+        self._nav_timer.setSingleShot(True)
+        self._nav_timer.setInterval(16)
+        self._nav_timer.timeout.connect(self.update_nav_buttons)
+        self.vialsAdded.connect(self.on_vials_added)
         
         # self.vial_arrow_prev.setStyleSheet("text-align:center;")
         # self.vial_arrow_next.setStyleSheet("text-align:center;")
@@ -851,16 +1299,22 @@ class ManageVialsWidget(QWidget):
         vial_arrows_layout.addWidget(self.vial_arrow_prev)
         vial_arrows_layout.addWidget(self.vial_arrow_next)
         
-        self.vial_list = QListWidget()
+        self._model = VialListModel(self)
+        self.vial_list = QListView()
+        self.vial_list.setModel(self._model)
+        self.vial_list.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        # Vial IDs are short single lines, so every row is the same height;
+        # big lists are laid out in batches so the GUI stays responsive
+        self.vial_list.setUniformItemSizes(True)
+        self.vial_list.setLayoutMode(QListView.Batched)
+        self.vial_list.setBatchSize(256)
         self.list_controls = VialListControlWidget()
 
-        self.vial_list.currentItemChanged.connect(self.index_changed)
+        self.vial_list.selectionModel().currentChanged.connect(self.index_changed)
         self.vialSelected.connect(self.on_vial_selected)
         
-        self.list_controls.add_from_file_button.clicked.connect(self.pick_file)
-        # self.list_controls.create_list_button.clicked.connect(self.)
-        self.list_controls.deselect_button.clicked.connect(self.deselect)        
-        self.list_controls.clear_list_button.clicked.connect(self.clear_vial_list)
+        for button, slot in self._CONNECTIONS:
+            getattr(self.list_controls, button).clicked.connect(getattr(self, slot))
 
         self.vial_arrow_prev.clicked.connect(self.prev_vial)
         self.vial_arrow_next.clicked.connect(self.next_vial)
@@ -879,18 +1333,18 @@ class ManageVialsWidget(QWidget):
         # self.vial_arrow_next.setEnabled(True)
     
 
-    @pyqtSlot(QListWidgetItem)
-    def index_changed(self, item):
-        # print("Vial selected: " + item.text())
-        self.vialSelected.emit("vial" + item.text())
+    @pyqtSlot(QModelIndex, QModelIndex)
+    def index_changed(self, current, previous):
+        if current.isValid():
+            self.vialSelected.emit("vial" + current.data())
     
     @pyqtSlot()
     def prev_vial(self):
-        self.vial_list.setCurrentRow(self.vial_list.currentRow()-1)
+        self.vial_list.setCurrentIndex(self._model.index(self.vial_list.currentIndex().row()-1))
         
     @pyqtSlot()
     def next_vial(self):
-        self.vial_list.setCurrentRow(self.vial_list.currentRow()+1)
+        self.vial_list.setCurrentIndex(self._model.index(self.vial_list.currentIndex().row()+1))
         
     @pyqtSlot()
     def add_vial(self):
@@ -899,31 +1353,50 @@ class ManageVialsWidget(QWidget):
             
     @pyqtSlot()
     def add_vial_unique(self, user_input):
-        vials = [i.text() for i in self.vial_list.findItems(user_input, QtCore.Qt.MatchExactly)]
-        if user_input not in vials:
+        self.add_vials_unique([user_input])
+    
+    def add_vials_unique(self, vials):
+        ''' Add every vial in `vials` that isn't already in the list. '''
+        added = self._model.add_unique(vials)
+        if added:
             self.list_controls.clear_list_button.setEnabled(True)
             self.list_controls.save_list_button.setEnabled(True)
-            self.vial_list.addItem(user_input)
+            self.vialsAdded.emit(added)
             
     @pyqtSlot()
     def on_vial_selected(self):
         self.list_controls.deselect_button.setEnabled(True)
-        if self.vial_list.currentRow() > 0:
-            self.vial_arrow_prev.setEnabled(True)
-        else:
-            self.vial_arrow_prev.setEnabled(False)
-        if self.vial_list.currentRow() < self.vial_list.count()-1:
-            self.vial_arrow_next.setEnabled(True)
-        else:
-            self.vial_arrow_next.setEnabled(False)
+        if not self._nav_timer.isActive():
+            self._nav_timer.start()
+    
+    @pyqtSlot(int)
+    def on_vials_added(self, count):
+        # A bulk load can give the selected vial a new neighbour
+        if not self._nav_timer.isActive():
+            self._nav_timer.start()
+    
+    @pyqtSlot()
+    def update_nav_buttons(self):
+        ''' Enable the arrows that lead to another vial. '''
+        row = self.vial_list.currentIndex().row()
+        prev_en = row > 0
+        next_en = row < self._model.rowCount()-1
+        if prev_en != self._last_prev_en:
+            self.vial_arrow_prev.setEnabled(prev_en)
+            self._last_prev_en = prev_en
+        if next_en != self._last_next_en:
+            self.vial_arrow_next.setEnabled(next_en)
+            self._last_next_en = next_en
         
     @pyqtSlot()
     def deselect(self):
-        self.vial_list.currentItem().setSelected(False)
+        self.vial_list.selectionModel().clearSelection()
         self.list_controls.deselect_button.setEnabled(False)
     
     @pyqtSlot()
     def clear_vial_list(self):
+        if not self._model.vials:
+            return
         confirm_button = QMessageBox.question(
             self,
             "Are you sure?",
@@ -932,28 +1405,40 @@ class ManageVialsWidget(QWidget):
         if confirm_button == QMessageBox.StandardButton.Yes:
             self.list_controls.clear_list_button.setEnabled(False)
             self.list_controls.save_list_button.setEnabled(False)
-            self.vial_list.clear()
+            self._model.clear()
     
     @pyqtSlot()
     def pick_file(self):
         csvfile = QFileDialog.getOpenFileName(self, "Open File", "", "Text files (*.txt *.csv)")[0]
+        if not csvfile:
+            return
         print("Loading vials from file:", csvfile)
-        vials_to_add = self.read_vial_csv(csvfile)
-        [self.add_vial_unique(vial) for vial in vials_to_add]
-    
-    def read_vial_csv(self, filename):
-        vials = []
+        # The file is read as the vials are added; add_vials_unique only
+        # changes the list once the whole file has been read
         try:
-            with open(filename, "r", newline='') as f:
-                reader = csv.reader(f)
-                line1 = next(reader)
-                if not line1[0].lower().startswith("vial"):
-                    if not line1[0].lower().startswith("id"):
-                        vials.append(line1[0])
-                for row in reader:
-                    vials.append(row[0])
-        finally:
-            return vials
+            self.add_vials_unique(vial for vial in self.iter_vial_csv(csvfile) if vial)
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            QMessageBox.warning(self, "Could not load vials", f"Could not read {csvfile}:\n{e}")
+    
+    def iter_vial_csv(self, filename):
+        ''' Yield the vial IDs in the first column of a csv file, skipping
+        a header row and blank lines. '''
+        # A large buffer keeps the number of reads down on slow SD cards
+        with open(filename, "r", newline='', buffering=1<<20) as f:
+            reader = csv.reader(f)
+            line1 = next(reader, None)
+            if line1:
+                first = line1[0]
+                # Only the first four characters matter for the header check
+                if not first[:4].lower().startswith(("vial", "id")):
+                    yield first
+            for row in reader:
+                if row:
+                    yield row[0]
+    
+    @property
+    def vials(self):
+        return self._model.vials
         
 class VialListControlWidget(QGroupBox):
     def __init__(self, *args, **kwargs):
@@ -972,35 +1457,38 @@ class VialListControlWidget(QGroupBox):
         self.save_list_button.setEnabled(False)
         self.deselect_button.setEnabled(False)
         
+        # Place the buttons in a single column at fixed cells
         # layout.addWidget(self.add_from_file_button)
-        layout.addWidget(self.create_list_button)
+        layout.addWidget(self.create_list_button, 0, 0)
         # layout.addWidget(self.save_list_button)
-        layout.addWidget(self.clear_list_button)
-        layout.addWidget(self.deselect_button)
+        layout.addWidget(self.clear_list_button, 1, 0)
+        layout.addWidget(self.deselect_button, 2, 0)
         
 
 # CUSTOM WIDGETS =======================================================
+# Input validators, built once and shared by every widget that uses them
+_CHAR_VALIDATOR = QRegExpValidator(QRegExp("[a-zA-Z]"))
+_INITIALS_VALIDATOR = QRegExpValidator(QRegExp("[a-zA-Z]{2,3}"))
+_INITIALS_OPT_VALIDATOR = QRegExpValidator(QRegExp("([a-zA-Z]{2,3})?"))
+
+# Batch letters and the value of each letter for CharSpinBox
+_LETTERS = tuple(string.ascii_uppercase)
+_LETTER_INDEX = {c: i for i, c in enumerate(_LETTERS)}
+
 class CharSpinBox(QSpinBox):
     def __init__(self, parent = None):
         super().__init__(parent)
-        self.letters = string.ascii_uppercase
         self.setRange(0, 25)
         self.setWrapping(True)
         
     def textFromValue(self, value):
-        return self.letters[value]
+        return _LETTERS[value]
     
     def validate(self, text, pos):
-        v = QRegExpValidator()
-        v.setRegExp(QRegExp("[a-zA-Z]"))
-        return v.validate(text, pos)
+        return _CHAR_VALIDATOR.validate(text, pos)
         
     def valueFromText(self, text):
-        text = text.upper()
-        if text in self.letters:
-            return self.letters.index(text)
-        else:
-            return 0
+        return _LETTER_INDEX.get(text.upper(), 0)
     
     def setValue(self, value):
         if isinstance(value, int):
@@ -1009,18 +1497,18 @@ class CharSpinBox(QSpinBox):
             super().setValue(self.valueFromText(value))
 
 class SettingsWidget(QWidget):
+    initials_validator = _INITIALS_VALIDATOR
+    
     def __init__(self):
         super().__init__()
-        self.settings = QSettings("Auburn University", "ImCapp")
+        self.settings = _settings()
         
         self.load_defaults_button = QPushButton("Use Defaults")
         self.save_defaults_button = QPushButton("Save as Defaults")
         self.change_defaults_button = QPushButton("Change Defaults")
         
         self.initialsLineEdit = QLineEdit()
-        initials_validator = QRegExpValidator()
-        initials_validator.setRegExp(QRegExp("[a-zA-Z]{2,3}"))
-        self.initialsLineEdit.setValidator(initials_validator)
+        self.initialsLineEdit.setValidator(self.initials_validator)
         
         self.experimentSpinBox = QSpinBox()
         self.experimentSpinBox.setValue(1)
@@ -1028,6 +1516,9 @@ class SettingsWidget(QWidget):
         
         self.batchSpinBox = CharSpinBox()
         
+        self.formatComboBox = QComboBox()
+        self.formatComboBox.addItems([".png", ".jpg"])
+        
         self.checkbox = QCheckBox("Create starting sample list")
         self.checkbox.setCheckState(Qt.Checked)
         
@@ -1035,6 +1526,7 @@ class SettingsWidget(QWidget):
         form_layout.addRow(self.tr("Initials:"), self.initialsLineEdit)
         form_layout.addRow(self.tr("Experiment number:"), self.experimentSpinBox)
         form_layout.addRow(self.tr("Batch ID:"), self.batchSpinBox)
+        form_layout.addRow(self.tr("File format:"), self.formatComboBox)
         form_layout.addRow(self.checkbox)
         
         self.lowestSpinBox = QSpinBox()
@@ -1078,6 +1570,7 @@ class SettingsWidget(QWidget):
         
         self.checkbox.stateChanged.connect(self.if_make_list)
     
+    @pyqtSlot()
     def if_make_list(self):
         if self.checkbox.isChecked():
             self.range_container.show()
@@ -1088,102 +1581,81 @@ class SettingsWidget(QWidget):
         # if self.initialsLineEdit.hasAcceptableInput():
             # pass
     
+    @pyqtSlot()
     def change_defaults(self):
         defaults_dlg = DefaultsDialog(parent=self)
     
+    @pyqtSlot()
     def load_defaults(self):
-        self.initialsLineEdit.setText(self.settings.value("initials"))
-        self.experimentSpinBox.setValue(int(self.settings.value("exp_id")))
-        self.batchSpinBox.setValue(self.settings.value("batch_id"))
-        self.lowestSpinBox.setValue(int(self.settings.value("low")))
-        self.highestSpinBox.setValue(int(self.settings.value("high")))
+        self.initialsLineEdit.setText(_SettingsCache.get("initials"))
+        self.experimentSpinBox.setValue(int(_SettingsCache.get("exp_id")))
+        self.batchSpinBox.setValue(_SettingsCache.get("batch_id"))
+        self.formatComboBox.setCurrentText(_SettingsCache.get("file_ext"))
+        self.lowestSpinBox.setValue(int(_SettingsCache.get("low")))
+        self.highestSpinBox.setValue(int(_SettingsCache.get("high")))
     
+    @pyqtSlot()
     def reset_to_defaults(self):
         self.initialsLineEdit.setText(Default.initials)
         self.experimentSpinBox.setValue(Default.exp_id)
         self.batchSpinBox.setValue(Default.batch_id)
+        self.formatComboBox.setCurrentText(Default.file_ext)
         self.lowestSpinBox.setValue(Default.low)
         self.highestSpinBox.setValue(Default.high)
     
+    @pyqtSlot()
     def save_new_defaults(self):
-        self.settings.setValue("initials", self.initialsLineEdit.text().upper())
-        self.settings.setValue("exp_id", self.experimentSpinBox.text())
-        self.settings.setValue("batch_id", self.batchSpinBox.text())
-        self.settings.setValue("low", self.lowestSpinBox.text())
-        self.settings.setValue("high", self.highestSpinBox.text())
-
-    @property
-    def settings(self):
-        return self._settings
-
-    @settings.setter
-    def settings(self, value):
-        self._settings = value
-        
-    @property
-    def ok_button(self):
-        return self._ok_button
-
-    @ok_button.setter
-    def ok_button(self, value):
-        self._ok_button = value
-        
-    @property
-    def change_defaults_button(self):
-        return self._change_defaults_button
-    
-    @change_defaults_button.setter
-    def change_defaults_button(self, value):
-        self._change_defaults_button = value
-    
-    @property
-    def save_defaults_button(self):
-        return self._save_defaults_button
-    
-    @save_defaults_button.setter
-    def save_defaults_button(self, value):
-        self._save_defaults_button = value
-        
-    @property
-    def load_defaults_button(self):
-        return self._load_defaults_button
-    
-    @load_defaults_button.setter
-    def load_defaults_button(self, value):
-        self._load_defaults_button = value
-
-    @property
-    def userLineEdit(self):
-        return self._userLineEdit
-    
-    @userLineEdit.setter
-    def userLineEdit(self, value):
-        self._userLineEdit = value
-        
-    @property
-    def initialsLineEdit(self):
-        return self._initialsLineEdit
-    
-    @initialsLineEdit.setter
-    def initialsLineEdit(self, value):
-        self._initialsLineEdit = value
+        _SettingsCache.set("initials", self.initialsLineEdit.text().upper())
+        _SettingsCache.set("exp_id", self.experimentSpinBox.text())
+        _SettingsCache.set("batch_id", self.batchSpinBox.text())
+        _SettingsCache.set("file_ext", self.formatComboBox.currentText())
+        _SettingsCache.set("low", self.lowestSpinBox.text())
+        _SettingsCache.set("high", self.highestSpinBox.text())
 
 class DefaultsWidget(SettingsWidget):
+    # Initials are optional for the defaults
+    initials_validator = _INITIALS_OPT_VALIDATOR
+    
     def __init__(self):
         super().__init__()
         
-        initials_validator = QRegExpValidator()
-        initials_validator.setRegExp(QRegExp("([a-zA-Z]{2,3})?"))
-        super().initialsLineEdit.setValidator(initials_validator)
-        
-        super().change_defaults_button.hide()
-        super().save_defaults_button.hide()
-        super().load_defaults_button.setText("Reset Defaults")
-        super().load_defaults_button.clicked.connect(super().reset_to_defaults)
+        self.change_defaults_button.hide()
+        self.save_defaults_button.hide()
+        self.load_defaults_button.setText("Reset Defaults")
+        self.load_defaults_button.clicked.connect(self.reset_to_defaults)
 
 
 # DIALOGS ==============================================================
-class SettingsDialog(QDialog):
+class _ValidateLater():
+    ''' Mixin for dialogs whose OK/Save button depends on the initials.
+    
+    The dialog defines `validate_inputs`, which is run once typing pauses
+    rather than on every keystroke. `accept` runs any validation that is
+    still waiting and only closes the dialog if the button is enabled.
+    '''
+    
+    def setup_validation(self, accept_button, *line_edits):
+        ''' Validate `line_edits` shortly after they change; `accept_button`
+        is the button `validate_inputs` enables. '''
+        self._accept_button = accept_button
+        self._validate_timer = QTimer(self)
+        self._validate_timer.setSingleShot(True)
+        self._validate_timer.setInterval(50)
+        self._validate_timer.timeout.connect(self.validate_inputs)
+        for line_edit in line_edits:
+            self.watch_input(line_edit)
+    
+    def watch_input(self, line_edit):
+        line_edit.textChanged.connect(self._validate_timer.start)
+    
+    def accept(self):
+        if self._validate_timer.isActive():
+            self._validate_timer.stop()
+            self.validate_inputs()
+        if self._accept_button.isEnabled():
+            super().accept()
+
+class SettingsDialog(_ValidateLater, QDialog):
     def __init__(self, parent=None):
         super().__init__()
         buttons = QDialogButtonBox.Save | QDialogButtonBox.Cancel | QDialogButtonBox.Apply
@@ -1198,52 +1670,74 @@ class SettingsDialog(QDialog):
         self.tabs.setTabPosition(QTabWidget.West)
         
         self.settings_tab = SettingsWidget()
-        self.defaults_tab = DefaultsWidget()
+        # The Defaults tab is only built the first time it is needed; until
+        # then its page is empty (see load_defaults_tab)
+        self.defaults_tab = None
+        self._defaults_page = QWidget()
+        QVBoxLayout(self._defaults_page).setContentsMargins(0, 0, 0, 0)
         
         self.tabs.addTab(self.settings_tab, "Settings")
-        self.tabs.addTab(self.defaults_tab, "Defaults")
+        self.tabs.addTab(self._defaults_page, "Defaults")
+        # Every tab after the first can be hidden; the set of tabs is fixed
+        self._hideable_tabs = tuple(self.tabs.widget(i) for i in range(1, self.tabs.count()))
         layout = QVBoxLayout()
         layout.addWidget(self.tabs)
         layout.addWidget(self.button_box)
         self.setLayout(layout)
         
-        self.settings_tab.initialsLineEdit.textChanged.connect(self.validate_inputs)
+        self.setup_validation(self.save_button, self.settings_tab.initialsLineEdit)
         self.settings_tab.change_defaults_button.clicked.disconnect()
         self.settings_tab.change_defaults_button.clicked.connect(self.select_defaults_tab)
-        self.defaults_tab.initialsLineEdit.textChanged.connect(self.validate_inputs)
         self.tabs.currentChanged.connect(self.validate_inputs)
         
     def open(self):
-        self.exec()
+        return self.exec()
+    
+    def load_defaults_tab(self):
+        ''' Build the Defaults tab if it hasn't been built yet and return it. '''
+        if self.defaults_tab is None:
+            self.defaults_tab = DefaultsWidget()
+            self._defaults_page.layout().addWidget(self.defaults_tab)
+            self.watch_input(self.defaults_tab.initialsLineEdit)
+        return self.defaults_tab
     
+    @pyqtSlot()
     def open_settings(self):
         self.hide_all_tabs()
         self.settings_tab.show()
         self.exec()
     
+    @pyqtSlot()
     def open_defaults(self):
         self.hide_all_tabs()
-        self.defaults_tab.show()
+        self.load_defaults_tab()
+        self._defaults_page.show()
         self.exec()
     
+    @pyqtSlot()
     def hide_all_tabs(self):
-        for i in range(1, self.tabs.count()):
-            self.tabs.widget(i).hide()
+        for tab in self._hideable_tabs:
+            tab.hide()
     
+    @pyqtSlot()
     def select_defaults_tab(self):
-        self.tabs.setCurrentWidget(self.defaults_tab)
+        self.tabs.setCurrentWidget(self._defaults_page)
     
+    @pyqtSlot()
     def validate_inputs(self):
-        if self.tabs.currentWidget().initialsLineEdit.hasAcceptableInput():
+        current_tab = self.tabs.currentWidget()
+        if current_tab is self._defaults_page:
+            current_tab = self.load_defaults_tab()
+        if current_tab.initialsLineEdit.hasAcceptableInput():
             self.save_button.setEnabled(True)
         else:
             self.save_button.setEnabled(False)
         
-class StartUpDialog(QDialog):    
+class StartUpDialog(_ValidateLater, QDialog):
     def __init__(self, parent=None):
         super().__init__()
         self.setWindowTitle("Starting ImCapp")
-        self.settings = QSettings("Auburn University", "ImCapp")
+        self.settings = _settings()
         layout = QVBoxLayout()
         
         buttons = QDialogButtonBox.Ok | QDialogButtonBox.Cancel
@@ -1261,19 +1755,20 @@ class StartUpDialog(QDialog):
         self.setLayout(layout)
         self.validate_inputs()
         
-        self.options_widget.initialsLineEdit.textChanged.connect(self.validate_inputs)
+        self.setup_validation(self.ok_button, self.options_widget.initialsLineEdit)
     
+    @pyqtSlot()
     def validate_inputs(self):
         if self.options_widget.initialsLineEdit.hasAcceptableInput(): 
             self.ok_button.setEnabled(True)
         else:
             self.ok_button.setEnabled(False)
        
-class DefaultsDialog(QDialog):
+class DefaultsDialog(_ValidateLater, QDialog):
     def __init__(self, parent=None):
         super().__init__()
         self.setWindowTitle("Change Defaults")
-        self.settings = QSettings("Auburn University", "ImCapp")
+        self.settings = _settings()
         layout = QVBoxLayout()
         
         buttons = QDialogButtonBox.Save | QDialogButtonBox.Cancel
@@ -1289,11 +1784,12 @@ class DefaultsDialog(QDialog):
         layout.addWidget(self.button_box)
         self.setLayout(layout)
         
-        self.defaults_widget.initialsLineEdit.textChanged.connect(self.validate_inputs)
+        self.setup_validation(self.save_button, self.defaults_widget.initialsLineEdit)
         
         if self.exec():
             self.defaults_widget.save_new_defaults()
         
+    @pyqtSlot()
     def validate_inputs(self):
         if self.defaults_widget.initialsLineEdit.hasAcceptableInput():
             self.save_button.setEnabled(True)
@@ -1336,39 +1832,51 @@ class MakeVialListDialog(QDialog):
         layout.addLayout(form_layout)
         layout.addWidget(self.button_box)
         self.setLayout(layout)
+    
+    def reset(self, prefix = None):
+        ''' Put the inputs back to their starting values so the dialog can
+        be shown again. '''
+        self.prefixLineEdit.setText(str(prefix) if prefix else "")
+        self.lowestSpinBox.setValue(1)
+        self.highestSpinBox.setValue(99)
+        self.if_save.setChecked(False)
         
 
 # Prepare to run =======================================================
 def check_for_camera(camera_number = 0):
-    picam2 = None
+    ''' Return the camera, or None if it can't be opened. '''
     try:
-        picam2 = Picamera2(camera_number)
-    finally:
-        return picam2
+        return Picamera2(camera_number)
+    except Exception:
+        return None
+
+def probe_camera(camera_number = 0):
+    ''' Find the camera and pick its sensor mode. This can take a while,
+    so it is run on a worker thread. '''
+    picam2 = check_for_camera(camera_number)
+    if picam2 is not None:
+        choose_sensor(picam2)
+    return picam2
 
 def choose_sensor(picam2):
     settings = QSettings("Auburn University", "ImCapp")
-    sensor_modes = picam2.sensor_modes
-    max_idx = biggest = 0
-    for i, mode in enumerate(sensor_modes):
-        size = mode['size'][0] * mode['size'][1]
-        if size > biggest:
-            biggest = size
-            max_idx = i
-    width, height = sensor_modes[max_idx]['size']
+    # Use the sensor mode with the most pixels
+    mode = max(picam2.sensor_modes, key=lambda mode: mode['size'][0] * mode['size'][1])
+    width, height = mode['size']
     Default.set_default_dimensions(settings, width, height)
         
     
 # RUN ==================================================================    
 def main():
     # settings = QSettings("Auburn University", "ImCapp")
-    picam2 = check_for_camera()
-    if picam2 is not None:
-        choose_sensor(picam2)
     app = QApplication([])
+    settings_writer = SettingsWriter.instance()
+    settings_writer.start()
+    app.aboutToQuit.connect(settings_writer.stop)
     app.setWindowIcon(QIcon(os.path.join(basedir, "icons", "icon.svg")))
-    window = MainWindow(picam2)
+    window = MainWindow(None)
     window.show()
+    window.find_camera()
     app.exec()
 
 # Run the GUI